@@ -1,36 +1,53 @@
-def modify_ply_colors(input_ply_path, output_ply_path):
-    with open(input_ply_path, 'rb') as infile:
-        # 读取文件内容
-        content = infile.read()
+import mmap
+import os
+import shutil
 
-        # 查找头部部分（直到 'end_header'）
-        header_end = content.find(b'end_header')
 
-        if header_end == -1:
+def modify_ply_colors(input_ply_path, output_ply_path, chunk_size=8 * 1024 * 1024):
+    with open(input_ply_path, 'rb') as infile:
+        # 空文件无法 mmap，也不可能包含头部
+        if os.fstat(infile.fileno()).st_size == 0:
             print("没有找到 'end_header' 标记")
             return
 
-        # 截取头部（包括 'end_header'）
-        header = content[:header_end + len(b'end_header')]
-
-        # 将头部从二进制转换为字符串，便于修改
-        header_str = header.decode('utf-8', errors='ignore')
-
-        # 修改属性名称
-        header_str = header_str.replace('property uchar red', 'property uchar diffuse_red')
-        header_str = header_str.replace('property uchar green', 'property uchar diffuse_green')
-        header_str = header_str.replace('property uchar blue', 'property uchar diffuse_blue')
-
-        # 创建新的头部（用修改后的字符串）
-        new_header = header_str.encode('utf-8')
-
-        # 获取数据部分（头部之后的所有内容）
-        data = content[header_end + len(b'end_header'):]
-
-        # 将新的头部和数据部分写入新的文件
-        with open(output_ply_path, 'wb') as outfile:
-            outfile.write(new_header)
-            outfile.write(data)
+        # 映射文件，避免一次性把整个文件读入内存
+        mm = mmap.mmap(infile.fileno(), 0, access=mmap.ACCESS_READ)
+        try:
+            # 查找头部部分（直到 'end_header'）
+            header_end = mm.find(b'end_header')
+
+            if header_end == -1:
+                print("没有找到 'end_header' 标记")
+                return
+
+            # 截取头部（包括 'end_header'），直接在字节上修改，无需解码
+            data_start = header_end + len(b'end_header')
+            new_header = (mm[:data_start]
+                          .replace(b'property uchar red', b'property uchar diffuse_red')
+                          .replace(b'property uchar green', b'property uchar diffuse_green')
+                          .replace(b'property uchar blue', b'property uchar diffuse_blue'))
+
+            # 写入新的头部，数据部分（头部之后的所有内容）原样拷贝
+            with open(output_ply_path, 'wb') as outfile:
+                outfile.write(new_header)
+                outfile.flush()
+                try:
+                    # 在内核中直接拷贝，数据不经过用户态
+                    offset, remaining = data_start, len(mm) - data_start
+                    while remaining > 0:
+                        sent = os.sendfile(outfile.fileno(), infile.fileno(), offset, remaining)
+                        if sent == 0:
+                            break
+                        offset += sent
+                        remaining -= sent
+                except (AttributeError, OSError):
+                    # 平台不支持文件间 sendfile 时，按块拷贝
+                    outfile.seek(len(new_header))
+                    outfile.truncate()
+                    mm.seek(data_start)
+                    shutil.copyfileobj(mm, outfile, chunk_size)
+        finally:
+            mm.close()
 
     print(f"PLY 文件已修改并保存为 {output_ply_path}")
 
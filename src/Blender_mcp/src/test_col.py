@@ -69,22 +69,25 @@ else:
 #     else:
 #         break
 
-# 将颜色数据存储为数组（顶点索引 → 颜色）
-color_data = np.zeros(len(mesh.vertices), dtype=np.float64)
-colors = np.column_stack((
-    red_attr.data.foreach_get("value", color_data),
-    green_attr.data.foreach_get("value", color_data),
-    blue_attr.data.foreach_get("value", color_data)
-))
-
-# 将颜色应用到顶点颜色层（按循环）
-for poly in mesh.polygons:
-    for loop_idx in poly.loop_indices:
-        loop = mesh.loops[loop_idx]
-        vertex_idx = loop.vertex_index
-        # 转换为RGBA（0.0-1.0）
-        r, g, b = colors[vertex_idx]
-        color_layer.data[loop_idx].color = (r, g, b, 1.0)
+# 将颜色数据存储为数组（顶点索引 → 颜色），foreach_get 直接写入传入的数组
+n_verts = len(mesh.vertices)
+red = np.empty(n_verts, dtype=np.float32)
+green = np.empty(n_verts, dtype=np.float32)
+blue = np.empty(n_verts, dtype=np.float32)
+red_attr.data.foreach_get("value", red)
+green_attr.data.foreach_get("value", green)
+blue_attr.data.foreach_get("value", blue)
+colors = np.column_stack((red, green, blue))
+
+# 获取每个循环对应的顶点索引
+loops_vidx = np.empty(len(mesh.loops), dtype=np.int32)
+mesh.loops.foreach_get("vertex_index", loops_vidx)
+
+# 将颜色应用到顶点颜色层（按循环，转换为RGBA 0.0-1.0），一次性写入
+rgba = np.empty((len(mesh.loops), 4), dtype=np.float32)
+rgba[:, :3] = colors[loops_vidx]
+rgba[:, 3] = 1.0
+color_layer.data.foreach_set("color", rgba.ravel())
 
 # 打印前3个顶点的颜色值（验证）
 print("\n前3个顶点颜色值（0.0-1.0）:")
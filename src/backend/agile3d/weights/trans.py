@@ -5,13 +5,14 @@ import numpy as np
 # 1. 加载 .pth 文件中的点云数据
 # 假设 .pth 文件中存储的是一个 3D 点云的坐标（例如 [N, 3] 的张量）
 pth_file = 'checkpoint1099.pth'  # 替换为你的 .pth 文件路径
-point_cloud_data = torch.load(pth_file)  # 加载 .pth 文件
+point_cloud_data = torch.load(pth_file, map_location='cpu', weights_only=True)  # 直接加载到 CPU
 
 # 假设 point_cloud_data 是一个形状为 [N, 3] 的 Tensor，其中 N 是点的数量
 # 如果是其他格式，需根据实际情况进行调整
 
 # 2. 转换为 NumPy 数组
-points = point_cloud_data.numpy()  # 转为 NumPy 数组
+# 直接转为连续的 float64，Vector3dVector 无需再做类型转换
+points = point_cloud_data.detach().to(torch.float64).contiguous().numpy()
 
 # 3. 使用 Open3D 创建点云对象
 pcd = o3d.geometry.PointCloud()
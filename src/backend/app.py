@@ -1,6 +1,11 @@
+import asyncio
+import json
+import multiprocessing
 import os
 import shutil
 import tempfile
+import threading
+from concurrent.futures import ProcessPoolExecutor
 from typing import Dict, List, Any
 
 import numpy as np
@@ -10,19 +15,18 @@ import subprocess
 import uuid
 from fastapi import FastAPI, File, UploadFile, Body
 from fastapi.middleware.cors import CORSMiddleware
-from fastapi.responses import JSONResponse, FileResponse
+from fastapi.responses import JSONResponse, FileResponse, ORJSONResponse
 from fastapi.staticfiles import StaticFiles
 from pydantic import BaseModel
 
 # Import the pre segmentation module
 from pointcloud_filter import filt_pointcloud
-from voxelizer import find_position
 from view_rendering import test_camera_positions
 from segmentor import pre_segment
 
 # Import the inference module
-from inference import Click, ClickHandler, PointCloudInference
-from visual_obj_recognition import mask_obj_recognition
+from inference import Click, ClickHandler, PointCloudInference, detect_geometry_type
+from visual_obj_recognition import mask_obj_recognition_worker
 
 
 # Create static directory if it doesn't exist
@@ -50,6 +54,16 @@ current_point_cloud_path = None
 current_inference = None
 current_results = None
 
+# Copy uploads to disk in large chunks to keep the number of write syscalls low
+UPLOAD_CHUNK_SIZE = 8 * 1024 * 1024
+
+# Persistent Blender renderer, started on first use and fed JSON commands over stdin
+BLENDER_PATH = "/path/to/blender"
+BLENDER_DONE_MARKER = "RENDER_DONE"  # Must match DONE_MARKER in control_blender.py
+BLENDER_ERROR_MARKER = "RENDER_ERROR"  # Must match ERROR_MARKER in control_blender.py
+blender_process = None
+blender_lock = threading.Lock()
+
 
 class InferenceRequest(BaseModel):
     clickData: Dict[str, Dict[str, Any]]  # clickIdx, clickTimeIdx, clickPositions
@@ -82,47 +96,40 @@ async def upload_point_cloud(file: UploadFile = File(...)):
     try:
         # Save the uploaded file
         file_path = os.path.join(temp_dir, file.filename)
-        with open(file_path, 'wb') as f:
-            shutil.copyfileobj(file.file, f)
+        fd = os.open(file_path, os.O_WRONLY | os.O_CREAT | os.O_TRUNC | os.O_CLOEXEC, 0o644)
+        with os.fdopen(fd, 'wb') as f:
+            shutil.copyfileobj(file.file, f, UPLOAD_CHUNK_SIZE)
 
         # Store the file path for later use
         current_point_cloud_path = file_path
 
-        # Load the point cloud
-        pcd_type = o3d.io.read_file_geometry_type(file_path)
-
-        if pcd_type == o3d.io.FileGeometry.CONTAINS_TRIANGLES:
-            # It's a mesh
-            mesh = o3d.io.read_triangle_mesh(file_path)
-            coords = np.array(mesh.vertices)
-            colors = np.array(mesh.vertex_colors) if mesh.has_vertex_colors() else np.ones(
-                (len(mesh.vertices), 3)) * 0.5
-            is_point_cloud = False
-        elif pcd_type == o3d.io.FileGeometry.CONTAINS_POINTS:
-            # It's a point cloud
-            pcd = o3d.io.read_point_cloud(file_path)
-            coords = np.array(pcd.points)
-            colors = np.array(pcd.colors) if pcd.has_colors() else np.ones((len(pcd.points), 3)) * 0.5
-            is_point_cloud = True
-        else:
+        # Reject unsupported files before building the model
+        pcd_type = detect_geometry_type(file_path)
+        if pcd_type not in (o3d.io.FileGeometry.CONTAINS_TRIANGLES, o3d.io.FileGeometry.CONTAINS_POINTS):
             return JSONResponse(
                 status_code=400,
                 content={"message": f"Unsupported file format: {file.filename}"}
             )
 
-        # Initialize the inference object
+        # Initialize the inference object, which loads the point cloud once
         current_inference = PointCloudInference(
             pretraining_weights='./agile3d/weights/checkpoint1099.pth',
             voxel_size=0.05
         )
         current_inference.load_point_cloud(file_path)
+        coords = current_inference.coords
 
-        # Store the full point cloud data (but don't return it to client)
+        # Bounding box is computed by Open3D in C++ in a single pass
+        aabb = current_inference.point_cloud.get_axis_aligned_bounding_box()
+
+        # Share the arrays held by the inference object (but don't return them to client)
         current_point_cloud = {
-            "is_point_cloud": is_point_cloud,
+            "is_point_cloud": current_inference.point_type == "pointcloud",
             "coords": coords,
-            "colors": colors,
-            "point_count": len(coords)
+            "colors": current_inference.colors,
+            "point_count": len(coords),
+            "bbox_min": aabb.min_bound,
+            "bbox_max": aabb.max_bound
         }
 
         # Return only metadata - no point cloud data
@@ -131,8 +138,8 @@ async def upload_point_cloud(file: UploadFile = File(...)):
             "filename": file.filename,
             "pointCount": len(coords),
             "boundingBox": {
-                "min": coords.min(axis=0).tolist(),
-                "max": coords.max(axis=0).tolist()
+                "min": aabb.min_bound.tolist(),
+                "max": aabb.max_bound.tolist()
             }
         })
 
@@ -155,12 +162,14 @@ async def pre_segmentation():
     # Filt center point cloud
     # center_coords = filt_pointcloud(current_point_cloud["coords"])
 
-    # Determine the height based on the center coordinates
-    max_height = coords.max(axis=0)[2]
-    min_height = coords.min(axis=0)[2]
+    # Determine the height based on the bounding box computed at upload
+    max_height = current_point_cloud["bbox_max"][2]
+    min_height = current_point_cloud["bbox_min"][2]
     height = (max_height * 2 + min_height) / 3
 
     # Find the camera position based on the center coordinates and height
+    # (voxelizer needs numba and JIT-compiles on import, so import it only here when re-enabled)
+    # from voxelizer import find_position
     # position = find_position(center_coords, height)
 
     # Render images(cover all directions)
@@ -204,33 +213,43 @@ async def run_inference(request: InferenceRequest):
         # Convert click data to format expected by inference
         click_handler = ClickHandler()
 
-        # Process click positions and create Click objects
+        # Gather click data as plain lists, then build the position tensor once
+        positions_list, obj_idx_list, obj_name_list, time_idx_list = [], [], [], []
         for obj_idx_str, positions in request.clickData["clickPositions"].items():
             obj_idx = int(obj_idx_str)
             obj_name = "background" if obj_idx == 0 else f"object_{obj_idx}"
 
-            # Get time indices for this object
+            # Get time indices for this object; every click needs its own
             time_indices = request.clickData["clickTimeIdx"][obj_idx_str]
-
-            for i, pos in enumerate(positions):
-                # Create click and add to handler
-                click = Click(
-                    position=torch.tensor(pos, dtype=torch.float32),
-                    obj_idx=obj_idx,
-                    obj_name=obj_name,
-                    time_idx=time_indices[i],
-                    is_positive=True,
-                    cube_size=request.cubeSize
+            if len(time_indices) != len(positions):
+                return JSONResponse(
+                    status_code=400,
+                    content={"message": f"Object {obj_idx} has {len(positions)} click positions "
+                                        f"but {len(time_indices)} click time indices."}
                 )
-                click_handler.clicks.append(click)
 
-                # Find nearest point in the point cloud
-                click.find_nearest_point(current_inference.raw_coords_qv)
-
-                # Update model-compatible formats
-                click_handler._update_click_dicts(click)
+            positions_list.extend(positions)
+            obj_idx_list.extend([obj_idx] * len(positions))
+            obj_name_list.extend([obj_name] * len(positions))
+            time_idx_list.extend(time_indices)
+
+        click_positions = torch.as_tensor(positions_list, dtype=torch.float32).reshape(-1, 3)
+
+        # Create Click objects as views on the rows of the position tensor
+        click_handler.clicks = [
+            Click(
+                position=click_positions[i],
+                obj_idx=obj_idx_list[i],
+                obj_name=obj_name_list[i],
+                time_idx=time_idx_list[i],
+                is_positive=True,
+                cube_size=request.cubeSize
+            )
+            for i in range(len(positions_list))
+        ]
 
-        # Set clicks in the inference object
+        # Set clicks in the inference object; nearest points are resolved with
+        # one KD-tree query when inference runs
         current_inference.click_handler = click_handler
 
         # Run inference
@@ -249,15 +268,13 @@ async def run_inference(request: InferenceRequest):
             "result_path": result_path
         }
 
-        # Prepare segmentation results for frontend
-        segmentation = mask.tolist()
+        print(f'number of positive in mask: {np.count_nonzero(mask == 1)}')
 
-        print(f'number of positive in mask: {segmentation.count(True)}')
-
-        return JSONResponse(content={
+        # Serialize the mask array directly with orjson, without building a Python list
+        return ORJSONResponse(content={
             "message": "Inference completed successfully",
             "segmentedPointCloud": {
-                "segmentation": segmentation
+                "segmentation": np.ascontiguousarray(mask)
             }
         })
 
@@ -270,12 +287,6 @@ async def run_inference(request: InferenceRequest):
         )
 
 
-def mask_obj_recognition_worker(args):
-    obj_id, point_cloud_path, mask_np = args
-    # Use mask_np.copy() if necessary to avoid sharing issues.
-    return mask_obj_recognition(point_cloud_path, mask_np.copy(), obj_id)
-
-
 @app.post("/api/mask_obj_recognition")
 async def run_mask_obj_recognition(request: MaskObjDetectionRequest):
     """
@@ -307,8 +318,12 @@ async def run_mask_obj_recognition(request: MaskObjDetectionRequest):
         # Convert to numpy array.
         mask_np = np.array(mask, dtype=int)
 
+        # Group point indices by object ID with a single sort.
+        order = np.argsort(mask_np, kind='stable').astype(np.int32)
+        sorted_mask = mask_np[order]
+
         # Find unique object IDs, excluding background (0).
-        unique_obj_ids = np.unique(mask_np)
+        unique_obj_ids = np.unique(sorted_mask)
         unique_obj_ids = unique_obj_ids[unique_obj_ids > 0]
 
         if len(unique_obj_ids) == 0:
@@ -317,13 +332,30 @@ async def run_mask_obj_recognition(request: MaskObjDetectionRequest):
                 content={"message": "No objects found in the mask (all values are 0/background)."}
             )
 
-        # Prepare arguments for each object.
+        starts = np.searchsorted(sorted_mask, unique_obj_ids, side='left')
+        ends = np.searchsorted(sorted_mask, unique_obj_ids, side='right')
+
+        # Prepare arguments for each object, passing only the indices of its points.
         work_args = [
-            (obj_id, current_point_cloud_path, mask_np)
-            for obj_id in unique_obj_ids
+            (int(obj_id), current_point_cloud_path, len(mask_np), order[start:end])
+            for obj_id, start, end in zip(unique_obj_ids, starts, ends)
         ]
 
-        result = [mask_obj_recognition_worker(args) for args in work_args]
+        # Each object is recognized independently, so dispatch them across processes. Workers are
+        # spawned rather than forked: this process holds CUDA contexts and Open3D's renderer,
+        # neither of which survives a fork. The pool only lives for this request.
+        loop = asyncio.get_running_loop()
+        executor = ProcessPoolExecutor(
+            max_workers=min(len(work_args), os.cpu_count() or 1),
+            mp_context=multiprocessing.get_context("spawn")
+        )
+        try:
+            # Await the workers so the event loop keeps serving other requests meanwhile
+            result = await asyncio.gather(*[
+                loop.run_in_executor(executor, mask_obj_recognition_worker, args) for args in work_args
+            ])
+        finally:
+            executor.shutdown(wait=False, cancel_futures=True)
 
         return JSONResponse(content={
             "message": "Mask object recognition completed successfully",
@@ -363,6 +395,28 @@ async def download_results():
         )
 
 
+def get_blender_process():
+    """
+    Start the persistent Blender renderer on first use, or again if it has exited
+    """
+    global blender_process
+    if blender_process is None or blender_process.poll() is not None:
+        blender_process = subprocess.Popen(
+            [BLENDER_PATH, "--background", "--python", "control_blender.py", "--", "--serve"],
+            stdin=subprocess.PIPE,
+            stdout=subprocess.PIPE,
+            text=True,
+            bufsize=1
+        )
+    return blender_process
+
+
+@app.on_event("shutdown")
+def stop_blender_process():
+    if blender_process is not None and blender_process.poll() is None:
+        blender_process.terminate()
+
+
 @app.post("/api/render_and_segment")
 def render(prompt: str = Body(...)):
     # TODO: 这里你可以用 LLM 或规则解析 prompt
@@ -370,11 +424,28 @@ def render(prompt: str = Body(...)):
     look_at = "0,0,0"
     output_file = f"/tmp/render_{uuid.uuid4()}.png"
 
-    # 启动 Blender 渲染
-    subprocess.run([
-        "/path/to/blender", "--background", "--python", "control_blender.py", "--",
-        "--pos", camera_pos, "--look", look_at, "--output", output_file
-    ])
+    # 交给常驻的 Blender 进程渲染，并等待完成或失败标记
+    error = "Blender exited before finishing the render"
+    with blender_lock:
+        process = get_blender_process()
+        try:
+            process.stdin.write(json.dumps({"pos": camera_pos, "look": look_at, "output": output_file}) + "\n")
+            process.stdin.flush()
+        except BrokenPipeError:
+            pass  # 进程已退出，下面读到 EOF 后按失败处理
+        for line in process.stdout:
+            if line.startswith(BLENDER_DONE_MARKER):
+                error = None
+                break
+            if line.startswith(BLENDER_ERROR_MARKER):
+                error = line[len(BLENDER_ERROR_MARKER):].strip()
+                break
+
+    if error is not None:
+        return JSONResponse(
+            status_code=500,
+            content={"message": f"Error rendering with Blender: {error}"}
+        )
 
     # TODO: 分割逻辑，这里可以调用 SAM、OpenCV、mask2former等
     segmentation_result = fake_segment(output_file)
@@ -387,12 +458,3 @@ def render(prompt: str = Body(...)):
 def fake_segment(image_path):
     return {"bbox": [100, 100, 300, 300], "label": "object"}
 
-
-# Run with uvicorn
-if __name__ == "__main__":
-    import uvicorn
-
-    # print("当前工作目录:", os.getcwd())
-    # Ensure output directory exists
-    os.makedirs("./outputs", exist_ok=True)
-    uvicorn.run(app, host="0.0.0.0", port=9500)
\ No newline at end of file
@@ -1,20 +1,58 @@
 import argparse
+import json
+import sys
 from src.Blender_mcp import CameraControl  # 假设文件存在
 
+# 常驻模式下每次渲染完成后输出的标记行，app.py 据此判断渲染结束
+DONE_MARKER = "RENDER_DONE"
+# 渲染失败时输出的标记行，进程继续等待下一条命令
+ERROR_MARKER = "RENDER_ERROR"
+
+
+def parse_vector(value):
+    return tuple(map(float, value.split(',')))
+
+
+def render(cam, pos, look, output):
+    cam.set_camera_position(parse_vector(pos))
+    cam.look_at(parse_vector(look))
+    cam.render_to_file(output)
+
+
+def serve(cam):
+    """
+    常驻模式：逐行从 stdin 读取 JSON 命令（pos, look, output）并渲染，
+    避免每次渲染都重新启动 Blender 和加载场景。
+    """
+    for line in sys.stdin:
+        line = line.strip()
+        if not line:
+            continue
+        # 单条命令出错（JSON 格式错误、渲染失败等）不能让常驻进程退出
+        try:
+            command = json.loads(line)
+            render(cam, command['pos'], command['look'], command['output'])
+        except Exception as e:
+            print(f"{ERROR_MARKER} {json.dumps({'error': repr(e)})}", flush=True)
+            continue
+        print(f"{DONE_MARKER} {json.dumps({'output': command['output']})}", flush=True)
+
+
 def main():
     parser = argparse.ArgumentParser()
     parser.add_argument('--pos', type=str, default='2,3,1')
     parser.add_argument('--look', type=str, default='0,0,0')
     parser.add_argument('--output', type=str, default='output.png')
-    args = parser.parse_args()
-
-    pos = tuple(map(float, args.pos.split(',')))
-    look = tuple(map(float, args.look.split(',')))
+    parser.add_argument('--serve', action='store_true')
+    # Blender 自身的参数在 '--' 之前
+    argv = sys.argv[sys.argv.index('--') + 1:] if '--' in sys.argv else sys.argv[1:]
+    args = parser.parse_args(argv)
 
     cam = CameraControl()
-    cam.set_camera_position(pos)
-    cam.look_at(look)
-    cam.render_to_file(args.output)
+    if args.serve:
+        serve(cam)
+    else:
+        render(cam, args.pos, args.look, args.output)
 
 if __name__ == '__main__':
     main()
@@ -16,11 +16,30 @@ import MinkowskiEngine as ME
 import numpy as np
 import open3d as o3d
 import torch
+from scipy.spatial import cKDTree
 
 from agile3d.interactive_tool.utils import get_obj_color
 from agile3d.models import build_model
 
 
+def detect_geometry_type(filepath: Union[str, Path]) -> o3d.io.FileGeometry:
+    """Tell a mesh from a point cloud using the PLY header only, without a full Open3D header parse."""
+    filepath = str(filepath)
+    with open(filepath, 'rb') as f:
+        head = f.read(4096)
+
+    # Leave non-PLY files, and headers too long to sniff, to Open3D
+    if not head.startswith(b'ply') or b'end_header' not in head:
+        return o3d.io.read_file_geometry_type(filepath)
+
+    for line in head.split(b'end_header', 1)[0].splitlines():
+        fields = line.split()
+        if len(fields) == 3 and fields[0] == b'element' and fields[1] == b'face':
+            if int(fields[2]) > 0:
+                return o3d.io.FileGeometry.CONTAINS_TRIANGLES
+    return o3d.io.FileGeometry.CONTAINS_POINTS
+
+
 @dataclass
 class Click:
     """A class to represent a user click in 3D space with relevant metadata."""
@@ -32,8 +51,13 @@ class Click:
     id: Optional[int] = None  # Index in the point cloud (set during processing)
     cube_size: float = 0.02  # Size of the selection cube around the click
 
-    def find_nearest_point(self, coords: torch.Tensor) -> int:
-        """Find the nearest point in the point cloud to this click."""
+    def find_nearest_point(self, coords: torch.Tensor, tree: Optional[cKDTree] = None) -> int:
+        """Find the nearest point in the point cloud to this click, using a prebuilt KD-tree over coords if given."""
+        if tree is not None:
+            _, nearest_idx = tree.query(self.position.detach().cpu().numpy(), k=1)
+            self.id = int(nearest_idx)
+            return self.id
+
         # Make sure position is on the same device as coords
         position = self.position.to(coords.device)
 
@@ -105,7 +129,7 @@ class ClickHandler:
         self.next_time_idx += 1
         return click
 
-    def add_clicks_from_file(self, filepath: str, coords: torch.Tensor) -> None:
+    def add_clicks_from_file(self, filepath: str, coords: torch.Tensor, tree: Optional[cKDTree] = None) -> None:
         """Load clicks from a JSON file and add them to the handler."""
         with open(filepath, 'r') as f:
             click_data = json.load(f)
@@ -120,7 +144,7 @@ class ClickHandler:
                 is_positive=click_info.get('is_positive', True),
                 cube_size=click_info.get('cube_size', 0.02)
             )
-            click.find_nearest_point(coords)
+            click.find_nearest_point(coords, tree)
             self.clicks.append(click)
             self.next_time_idx = max(self.next_time_idx, click.time_idx + 1)
 
@@ -136,8 +160,19 @@ class ClickHandler:
         with open(filepath, 'w') as f:
             json.dump(click_data, f, indent=2)
 
-    def process_clicks(self, coords: torch.Tensor) -> None:
+    def process_clicks(self, coords: torch.Tensor, tree: Optional[cKDTree] = None) -> None:
         """Find nearest points in the point cloud for all clicks."""
+        if tree is not None and self.clicks:
+            # One batched query against the prebuilt tree, then rebuild the dicts in one pass
+            nearest_idx = self.assign_nearest_points(tree)
+            self.bulk_update(
+                nearest_idx,
+                torch.stack([click.position.detach().cpu() for click in self.clicks]),
+                [click.obj_idx for click in self.clicks],
+                [click.time_idx for click in self.clicks]
+            )
+            return
+
         self.click_idx = {'0': []}
         self.click_time_idx = {'0': []}
         self.click_positions = {'0': []}
@@ -146,6 +181,45 @@ class ClickHandler:
             click.find_nearest_point(coords)
             self._update_click_dicts(click)
 
+    def assign_nearest_points(self, tree: cKDTree, clicks: Optional[List[Click]] = None) -> np.ndarray:
+        """Find the nearest points for several clicks with a single batched KD-tree query."""
+        clicks = self.clicks if clicks is None else clicks
+        if not clicks:
+            return np.empty(0, dtype=np.int64)
+
+        positions = np.stack([click.position.detach().cpu().numpy() for click in clicks]).astype(np.float32)
+        _, nearest_idx = tree.query(positions, k=1, workers=-1)
+        for click, idx in zip(clicks, nearest_idx):
+            click.id = int(idx)
+        return nearest_idx
+
+    def bulk_update(self, ids: np.ndarray, positions: torch.Tensor, obj_indices: List[int],
+                    time_indices: List[int]) -> None:
+        """Rebuild the dictionaries used by the model from all clicks at once, grouped by object index."""
+        self.click_idx = {'0': []}
+        self.click_time_idx = {'0': []}
+        self.click_positions = {'0': []}
+        if len(obj_indices) == 0:
+            return
+
+        ids = np.asarray(ids)
+        obj_indices = np.asarray(obj_indices)
+        time_indices = np.asarray(time_indices)
+        positions_np = positions.detach().cpu().numpy()
+
+        # Stable sort keeps the click order within each object
+        order = np.argsort(obj_indices, kind='stable')
+        obj_ids, first_seen, counts = np.unique(obj_indices, return_index=True, return_counts=True)
+        starts = np.concatenate(([0], np.cumsum(counts)[:-1]))
+
+        # Insert objects in the order they first appear, as _update_click_dicts would
+        for k in np.argsort(first_seen, kind='stable'):
+            rows = order[starts[k]:starts[k] + counts[k]]
+            obj_key = str(obj_ids[k])
+            self.click_idx[obj_key] = ids[rows].tolist()
+            self.click_time_idx[obj_key] = time_indices[rows].tolist()
+            self.click_positions[obj_key] = positions_np[rows].tolist()
+
     def _update_click_dicts(self, click: Click) -> None:
         """Update the dictionaries used by the model with a click."""
         if click.id is None:
@@ -247,6 +321,7 @@ class PointCloudInference:
         self.inverse_map = None
         self.unique_map = None
         self.raw_coords_qv = None
+        self._kdtree = None
 
     def load_point_cloud(self, filepath: Union[str, Path]) -> None:
         """Load a point cloud from a PLY file."""
@@ -262,21 +337,21 @@ class PointCloudInference:
             raise FileNotFoundError(f"Point cloud file not found: {filepath}")
 
         # Determine geometry type
-        pcd_type = o3d.io.read_file_geometry_type(filepath)
+        pcd_type = detect_geometry_type(filepath)
 
         if pcd_type == o3d.io.FileGeometry.CONTAINS_TRIANGLES:
             mesh = o3d.io.read_triangle_mesh(filepath)
             self.point_cloud = mesh
-            self.coords = np.array(mesh.vertices)
-            self.colors = np.array(mesh.vertex_colors) if mesh.has_vertex_colors() else np.ones(
+            self.coords = np.asarray(mesh.vertices)
+            self.colors = np.asarray(mesh.vertex_colors) if mesh.has_vertex_colors() else np.ones(
                 (len(mesh.vertices), 3)) * 0.5
             self.point_type = "mesh"
             print(f"Loaded mesh with {len(mesh.vertices)} vertices")
         elif pcd_type == o3d.io.FileGeometry.CONTAINS_POINTS:
             pcd = o3d.io.read_point_cloud(filepath)
             self.point_cloud = pcd
-            self.coords = np.array(pcd.points)
-            self.colors = np.array(pcd.colors) if pcd.has_colors() else np.ones((len(pcd.points), 3)) * 0.5
+            self.coords = np.asarray(pcd.points)
+            self.colors = np.asarray(pcd.colors) if pcd.has_colors() else np.ones((len(pcd.points), 3)) * 0.5
             self.point_type = "pointcloud"
             print(f"Loaded point cloud with {len(pcd.points)} points")
         else:
@@ -303,6 +378,7 @@ class PointCloudInference:
         self.inverse_map = inverse_map.to(self.device)
         self.colors_qv = torch.from_numpy(self.colors[unique_map]).float()
         self.raw_coords_qv = torch.from_numpy(self.coords[unique_map]).float().to(self.device)
+        self._kdtree = None
 
         # Compute backbone features
         data = ME.SparseTensor(
@@ -317,10 +393,16 @@ class PointCloudInference:
 
         print(f"Processed point cloud features: {self.pcd_features.F.shape}")
 
+    def get_kdtree(self) -> cKDTree:
+        """Get the KD-tree over raw_coords_qv, built on first use and kept until the next load."""
+        if self._kdtree is None:
+            self._kdtree = cKDTree(self.raw_coords_qv.detach().cpu().numpy())
+        return self._kdtree
+
     def load_clicks(self, filepath: str) -> None:
         """Load clicks from a file."""
         # Use raw_coords_qv for nearest point calculation
-        self.click_handler.add_clicks_from_file(filepath, self.raw_coords_qv)
+        self.click_handler.add_clicks_from_file(filepath, self.raw_coords_qv, self.get_kdtree())
         print(f"Loaded {len(self.click_handler.clicks)} clicks from {filepath}")
 
     def add_click(self, position: Union[np.ndarray, List[float], torch.Tensor], obj_idx: int, obj_name: str,
@@ -328,7 +410,7 @@ class PointCloudInference:
         """Add a new click and process it."""
         click = self.click_handler.add_click(position, obj_idx, obj_name, is_positive, cube_size)
         # Use raw_coords_qv for nearest point calculation
-        click.find_nearest_point(self.raw_coords_qv)
+        click.find_nearest_point(self.raw_coords_qv, self.get_kdtree())
         return click
 
     def run_inference(self) -> np.ndarray:
@@ -339,8 +421,8 @@ class PointCloudInference:
         if not self.click_handler.clicks:
             raise ValueError("No clicks available. Add clicks before running inference.")
 
-        # Process all clicks to find their nearest points using raw_coords_qv
-        self.click_handler.process_clicks(self.raw_coords_qv)
+        # Process all clicks to find their nearest points using the KD-tree over raw_coords_qv
+        self.click_handler.process_clicks(self.raw_coords_qv, self.get_kdtree())
 
         # Get click data in the format required by the model
         click_idx, click_time_idx, click_positions = self.click_handler.get_click_data_for_model()
@@ -469,11 +551,14 @@ class PointCloudInference:
 
         # Create colored point cloud for saving
         if self.point_type == "pointcloud":
-            vis_pcd = o3d.geometry.PointCloud()
-            vis_pcd.points = o3d.utility.Vector3dVector(self.coords)
-            vis_pcd.colors = o3d.utility.Vector3dVector(colors)
+            # Tensor API writes straight from contiguous arrays without Vector3dVector copies
+            vis_pcd = o3d.t.geometry.PointCloud(
+                o3d.core.Tensor.from_numpy(np.ascontiguousarray(self.coords, dtype=np.float64)))
+            vis_pcd.point["colors"] = o3d.core.Tensor.from_numpy(np.ascontiguousarray(colors, dtype=np.float32))
+            vis_pcd.point["label"] = o3d.core.Tensor.from_numpy(
+                np.ascontiguousarray(mask, dtype=np.int32).reshape(-1, 1))
             pcd_file = os.path.join(output_dir, f"{prefix}_result_{timestamp}.ply")
-            o3d.io.write_point_cloud(pcd_file, vis_pcd)
+            o3d.t.io.write_point_cloud(pcd_file, vis_pcd, write_ascii=False, compressed=False)
         else:  # Mesh
             vis_mesh = o3d.geometry.TriangleMesh()
             vis_mesh.vertices = o3d.utility.Vector3dVector(self.coords)
@@ -10,15 +10,17 @@ def filt_pointcloud(coords):
     # Create a KDTree for efficient neighbor search
     tree = cKDTree(coords)
 
-    # Query the tree for the nearest 10 neighbors
-    distances, _ = tree.query(coords, k=11)
+    # Query the tree for the nearest 10 neighbors in parallel across all cores
+    distances = tree.query(coords, k=11, workers=-1)[0]
 
     # Get the mean distance to the 10 nearest neighbors (excluding the point itself)
-    mean_10nn_dist = np.mean(distances[:, 1:], axis=1)
+    mean_10nn_dist = distances[:, 1:].mean(axis=1, dtype=np.float64)
 
-    # Calculate the mean and standard deviation of the mean distances
-    mean_val = np.mean(mean_10nn_dist)
-    std_val = np.std(mean_10nn_dist)
+    # Calculate the mean and standard deviation of the mean distances in one pass
+    n = mean_10nn_dist.shape[0]
+    mean_val = mean_10nn_dist.sum() / n
+    var_val = np.dot(mean_10nn_dist, mean_10nn_dist) / n - mean_val * mean_val
+    std_val = np.sqrt(max(var_val, 0.0))
 
     # Define a threshold for filtering
     threshold = mean_val + 3 * std_val
@@ -0,0 +1,16 @@
+"""
+Start the backend server.
+
+The FastAPI app is imported by uvicorn rather than here, so that this script stays light:
+process pool workers started with "spawn" re-run the main script, and must not import
+torch, detectron2 or the app itself again.
+"""
+import os
+
+import uvicorn
+
+# Run with uvicorn
+if __name__ == "__main__":
+    # Ensure output directory exists
+    os.makedirs("./outputs", exist_ok=True)
+    uvicorn.run("app:app", host="0.0.0.0", port=9500)
@@ -5,18 +5,71 @@ or a "full" mode that recolors masked points. Additionally, it includes a test f
 camera positions, save a combined scene (with camera markers), and render images from these views.
 """
 
+import functools
+import math
 import os
+from concurrent.futures import ThreadPoolExecutor, as_completed
 from pathlib import Path
 from typing import List, Tuple, Union, Optional
 import subprocess
+import cv2
 import numpy as np
 import open3d as o3d
 from open3d.visualization import rendering
 from scipy.spatial import cKDTree
-from scipy.spatial import KDTree
+# pykdtree 比 scipy 的实现更快，未安装时退回到 C 实现的 cKDTree（query 接口兼容）
+try:
+    from pykdtree.kdtree import KDTree
+except ImportError:
+    from scipy.spatial import cKDTree as KDTree
 from sklearn.decomposition import PCA
 from scipy.stats import multivariate_normal
 
+# Masks with more points than this are voxel-downsampled before computing the outline hull
+HULL_DOWNSAMPLE_THRESHOLD = 2000
+
+@functools.lru_cache(maxsize=4)
+def _read_geometry(
+        file_path: str,
+        mtime: float
+) -> Tuple[str, np.ndarray, Optional[np.ndarray], Union[o3d.geometry.TriangleMesh, o3d.geometry.PointCloud]]:
+    """
+    Reads a geometry file once per (path, modification time) and caches the result.
+    The returned coordinates and colors are read-only float32 copies of the geometry's buffers;
+    the colors are None if the file has none.
+    """
+    # Determine if the file contains a mesh (triangles) or a point cloud.
+    file_type = o3d.io.read_file_geometry_type(file_path)
+    if file_type == o3d.io.FileGeometry.CONTAINS_TRIANGLES:
+        geometry = o3d.io.read_triangle_mesh(file_path)
+        coords = np.asarray(geometry.vertices, dtype=np.float32)
+        colors = np.asarray(geometry.vertex_colors, dtype=np.float32) if geometry.has_vertex_colors() else None
+        geometry_type = "mesh"
+    else:
+        geometry = o3d.io.read_point_cloud(file_path)
+        coords = np.asarray(geometry.points, dtype=np.float32)
+        colors = np.asarray(geometry.colors, dtype=np.float32) if geometry.has_colors() else None
+        geometry_type = "pointcloud"
+    coords.flags.writeable = False
+    if colors is not None:
+        colors.flags.writeable = False
+    return geometry_type, coords, colors, geometry
+
+
+def _geometry_colors(
+        file_colors: Optional[np.ndarray],
+        num_points: int,
+        background_color: List[float]
+) -> np.ndarray:
+    """
+    Returns the colors read from the file, or the background color for every point if it has none.
+    The background colors are a read-only broadcast view, so no per-point array is allocated for them.
+    """
+    if file_colors is not None:
+        return file_colors
+    return np.broadcast_to(np.asarray(background_color, dtype=np.float32), (num_points, 3))
+
+
 def load_geometry_from_file(
         file_path: str | Path,
         background_color: List[float],
@@ -24,6 +77,8 @@ def load_geometry_from_file(
 ) -> Tuple[str, np.ndarray, np.ndarray, Union[o3d.geometry.TriangleMesh, o3d.geometry.PointCloud]]:
     """
     Loads a geometry from the specified file, determining whether it is a mesh or a point cloud.
+    Files are parsed once per modification time and reused across calls, so the returned
+    coordinates (and file colors) are read-only float32 arrays shared with the cache.
 
     Parameters:
         file_path (str or Path): Path to the file containing the geometry.
@@ -40,30 +95,13 @@ def load_geometry_from_file(
     Raises:
         None explicitly; errors from Open3D are propagated.
     """
-    # Determine if the file contains a mesh (triangles) or a point cloud.
     file_path = str(file_path)
-
-    file_type = o3d.io.read_file_geometry_type(file_path)
-    if file_type == o3d.io.FileGeometry.CONTAINS_TRIANGLES:
-        geometry = o3d.io.read_triangle_mesh(file_path)
-        coords = np.array(geometry.vertices)
-        # Use vertex colors if available, otherwise fill with the background color.
-        colors = (np.array(geometry.vertex_colors)
-                  if geometry.has_vertex_colors()
-                  else np.tile(background_color, (len(coords), 1)))
-        geometry_type = "mesh"
-        if debug:
-            print("Loaded mesh geometry from file.")
-    else:
-        geometry = o3d.io.read_point_cloud(file_path)
-        coords = np.array(geometry.points)
-        # Use point colors if available, otherwise fill with the background color.
-        colors = (np.array(geometry.colors)
-                  if geometry.has_colors()
-                  else np.tile(background_color, (len(coords), 1)))
-        geometry_type = "pointcloud"
-        if debug:
-            print("Loaded point cloud geometry from file.")
+    geometry_type, coords, file_colors, geometry = _read_geometry(file_path, os.path.getmtime(file_path))
+    # Use vertex colors if available, otherwise fill with the background color.
+    colors = _geometry_colors(file_colors, len(coords), background_color)
+    if debug:
+        print("Loaded mesh geometry from file." if geometry_type == "mesh"
+              else "Loaded point cloud geometry from file.")
     return geometry_type, coords, colors, geometry
 
 
@@ -86,17 +124,21 @@ def process_mask_mode(
 
     Returns:
         A tuple containing:
-            - updated_colors (np.ndarray): Modified colors array after applying the mask.
+            - updated_colors (np.ndarray): Modified colors array after applying the mask
+              ("outline" mode leaves the colors untouched and returns the input array itself).
             - outline (o3d.geometry.LineSet or None): LineSet representing the convex hull outline (if applicable).
 
     Raises:
         ValueError: If mask_mode is not "outline" or "full", or if no points are selected by the mask.
     """
-    updated_colors = colors.copy()
+    updated_colors = colors
     outline = None
 
     if mask_mode == "full":
         # For full mode, update the color of all masked points to the highlight color.
+        # colors may be a read-only view (shared with the geometry cache or broadcast from one color),
+        # so write into a materialized copy; this is the only full pass over the colors.
+        updated_colors = colors.copy()
         updated_colors[mask] = highlight_color
     elif mask_mode == "outline":
         if not mask.any():
@@ -105,6 +147,12 @@ def process_mask_mode(
         object_points = coords[mask]
         object_pcd = o3d.geometry.PointCloud()
         object_pcd.points = o3d.utility.Vector3dVector(object_points)
+        if len(object_points) > HULL_DOWNSAMPLE_THRESHOLD:
+            # Only the extremal points shape the hull, so thin out large masks on a voxel grid
+            # of 1% of the object's bounding diagonal first.
+            bounding_diag = np.linalg.norm(object_points.max(axis=0) - object_points.min(axis=0))
+            if bounding_diag > 0:
+                object_pcd = object_pcd.voxel_down_sample(voxel_size=bounding_diag * 0.01)
         hull, _ = object_pcd.compute_convex_hull()
         outline = o3d.geometry.LineSet.create_from_triangle_mesh(hull)
         outline.colors = o3d.utility.Vector3dVector(
@@ -139,17 +187,41 @@ def create_vis_geometry(
         vis_geometry.triangles = original_geometry.triangles
         vis_geometry.compute_vertex_normals()
     else:
-        vis_geometry = o3d.geometry.PointCloud()
-        vis_geometry.points = o3d.utility.Vector3dVector(coords)
-        vis_geometry.colors = o3d.utility.Vector3dVector(vis_colors)
-        vis_geometry.estimate_normals()
+        vis_geometry = _estimate_normals_cuda(coords, vis_colors)
+        if vis_geometry is None:
+            vis_geometry = o3d.geometry.PointCloud()
+            vis_geometry.points = o3d.utility.Vector3dVector(coords)
+            vis_geometry.colors = o3d.utility.Vector3dVector(vis_colors)
+            vis_geometry.estimate_normals()
     return vis_geometry
 
 
+def _estimate_normals_cuda(
+        coords: np.ndarray,
+        colors: np.ndarray
+) -> Optional[o3d.geometry.PointCloud]:
+    """
+    Builds a point cloud with normals estimated on the GPU through Open3D's tensor API.
+    Returns None if CUDA is unavailable or the GPU path fails, so the caller can use the legacy path.
+    """
+    if not o3d.core.cuda.is_available():
+        return None
+    try:
+        device = o3d.core.Device("CUDA:0")
+        tpcd = o3d.t.geometry.PointCloud(device)
+        tpcd.point.positions = o3d.core.Tensor(np.ascontiguousarray(coords), o3d.core.float32, device)
+        tpcd.point.colors = o3d.core.Tensor(np.ascontiguousarray(colors), o3d.core.float32, device)
+        tpcd.estimate_normals(max_nn=30)
+        return tpcd.to_legacy()
+    except RuntimeError as e:
+        print(f"CUDA normal estimation failed, falling back to CPU: {e}")
+        return None
+
+
 def render_object_views(
         point_cloud_path: str,
         mask: Union[List[bool], np.ndarray],
-        camera_pos: List[List[float]],
+        camera_pos: Union[List[List[float]], np.ndarray],
         output_dir: str = "./object_views",
         image_size: Tuple[int, int] = (1280, 720),
         highlight_color: List[float] = [1.0, 0.0, 0.0],
@@ -160,6 +232,7 @@ def render_object_views(
 
         look_outward: bool = False,  # 新增参数
         scene_center: List[float] = None,
+        preloaded: Optional[Tuple] = None,
 ) -> List[str]:
     """
     Renders views of an object based on a mask and a set of camera positions.
@@ -167,7 +240,7 @@ def render_object_views(
     Parameters:
         point_cloud_path (str): Path to the point cloud or mesh file.
         mask (List[bool] or np.ndarray): Boolean mask indicating object points.
-        camera_pos (List[List[float]]): List of camera positions (each as [x, y, z]).
+        camera_pos (List[List[float]] or np.ndarray): Camera positions (each as [x, y, z]), or an (N, 3) array.
         output_dir (str): Directory to save the rendered images.
         image_size (Tuple[int, int]): Width and height of the rendered images.
         highlight_color (List[float]): Color used for highlighting the masked object.
@@ -175,6 +248,8 @@ def render_object_views(
         view_angle (float): Camera field of view angle in degrees.
         mask_mode (str): Visualization mode ("outline" or "full").
         debug (bool): If True, prints debug messages.
+        preloaded (Optional[Tuple]): Cached (geometry_type, coords, file_colors, geometry) of point_cloud_path,
+            reused instead of loading again. file_colors is None if the file has no colors.
 
     Returns:
         List[str]: List of file paths to the rendered image views.
@@ -184,9 +259,14 @@ def render_object_views(
     """
     # Ensure output directory exists.
     os.makedirs(output_dir, exist_ok=True)
+    camera_pos = np.asarray(camera_pos, dtype=np.float64).reshape(-1, 3)
 
-    # Load the geometry from the specified file.
-    geometry_type, coords, colors, geometry = load_geometry_from_file(point_cloud_path, background_color, debug)
+    # Load the geometry from the specified file, unless the caller already has it.
+    if preloaded is None:
+        geometry_type, coords, colors, geometry = load_geometry_from_file(point_cloud_path, background_color, debug)
+    else:
+        geometry_type, coords, file_colors, geometry = preloaded
+        colors = _geometry_colors(file_colors, len(coords), background_color)
     mask_bool = np.array(mask, dtype=bool)
 
     if mask_bool.shape[0] != len(coords):
@@ -219,29 +299,41 @@ def render_object_views(
         # Compute the center of the masked object.
         object_center = np.mean(coords[mask_bool], axis=0)
 
-    image_paths = []
-    # Iterate over each camera position, render the scene, and save the output image.
-    for idx, eye in enumerate(camera_pos):
-        eye = np.array(eye)
-        if look_outward:
-            target = 2 * eye - scene_center
+    # The projection is the same for every view, so set it once.
+    aspect = width / height
+    renderer.scene.camera.set_projection(
+        view_angle, aspect, near_plane, far_plane, rendering.Camera.FovType.Vertical
+    )
 
-            up = np.array([0, 0, 1])
+    # Compute every look-at target up front: either facing away from the scene center,
+    # or towards the object center.
+    up = np.array([0.0, 0.0, 1.0])
+    if look_outward:
+        targets = 2 * camera_pos - np.asarray(scene_center, dtype=np.float64)
+    else:
+        targets = np.broadcast_to(object_center, camera_pos.shape)
 
-            renderer.scene.camera.look_at(target, eye, up)
-        else:
-            renderer.scene.camera.look_at(object_center, eye, np.array([0, 0, 1]))
-        # renderer.scene.camera.look_at(object_center, eye, np.array([0, 0, 1]))
-        aspect = width / height
-        renderer.scene.camera.set_projection(
-            view_angle, aspect, near_plane, far_plane, rendering.Camera.FovType.Vertical
-        )
-        img = renderer.render_to_image()
-        image_path = os.path.join(output_dir, f"view_{idx:03d}.png")
-        o3d.io.write_image(image_path, img)
-        image_paths.append(image_path)
-        if debug:
-            print(f"Saved view {idx} to {image_path}")
+    image_paths = []
+    # Iterate over each camera position and render the scene. PNG encoding runs on worker
+    # threads (OpenCV releases the GIL while encoding) so that it overlaps with rendering the next views.
+    # No more threads than views: this may itself run in one of several recognition worker processes.
+    with ThreadPoolExecutor(max_workers=max(1, min(len(camera_pos), os.cpu_count() or 1))) as executor:
+        futures = {}
+        for idx in range(len(camera_pos)):
+            renderer.scene.camera.look_at(targets[idx], camera_pos[idx], up)
+            img = renderer.render_to_image()
+            image_path = os.path.join(output_dir, f"view_{idx:03d}.png")
+            # Rendered images are RGB while OpenCV writes BGR.
+            img_bgr = cv2.cvtColor(np.asarray(img), cv2.COLOR_RGB2BGR)
+            futures[executor.submit(cv2.imwrite, image_path, img_bgr)] = (idx, image_path)
+            image_paths.append(image_path)
+
+        for future in as_completed(futures):
+            idx, image_path = futures[future]
+            if not future.result():
+                raise IOError(f"Failed to write view {idx} to {image_path}")
+            if debug:
+                print(f"Saved view {idx} to {image_path}")
     return image_paths
 
 
@@ -267,45 +359,46 @@ def compute_object_center_and_radius(
         raise ValueError("No masked points found in the geometry.")
     masked_coords = coords[mask]
     center = np.mean(masked_coords, axis=0)
-    bounding_radius = np.max(np.linalg.norm(masked_coords - center, axis=1))
+    diff = masked_coords - center
+    bounding_radius = math.sqrt(np.einsum('ij,ij->i', diff, diff).max())
     return center, bounding_radius
 
 
+@functools.lru_cache(maxsize=1)
+def _unit_sphere_points(num_points: int = 500) -> np.ndarray:
+    """
+    Samples points uniformly from a unit sphere once and reuses them for every camera marker.
+    """
+    sphere_mesh = o3d.geometry.TriangleMesh.create_sphere(radius=1.0)
+    points = np.asarray(sphere_mesh.sample_points_uniformly(number_of_points=num_points).points)
+    points.flags.writeable = False
+    return points
+
+
 def create_camera_markers(
-        camera_positions: List[List[float]], bounding_radius: float
+        camera_positions: Union[List[List[float]], np.ndarray], bounding_radius: float
 ) -> o3d.geometry.PointCloud:
     """
     Creates visual markers at the specified camera positions.
 
     Parameters:
-        camera_positions (List[List[float]]): List of camera positions.
+        camera_positions (List[List[float]] or np.ndarray): Camera positions, as a list or an (N, 3) array.
         bounding_radius (float): Bounding radius of the object (used to size the markers).
 
     Returns:
         o3d.geometry.PointCloud: A point cloud containing markers for the camera positions.
     """
-    camera_marker_clouds = []
+    camera_positions = np.asarray(camera_positions, dtype=np.float64).reshape(-1, 3)
+    camera_cloud = o3d.geometry.PointCloud()
+    if len(camera_positions) == 0:
+        return camera_cloud
     # Determine a sphere radius for the camera markers.
     sphere_radius = bounding_radius * 0.1 if bounding_radius > 0 else 0.1
-    for pos in camera_positions:
-        # Create a sphere mesh for each camera marker.
-        sphere_mesh = o3d.geometry.TriangleMesh.create_sphere(radius=sphere_radius)
-        sphere_mesh.translate(np.array(pos))
-        sphere_mesh.paint_uniform_color([0.0, 1.0, 0.0])
-        # Sample points uniformly from the sphere mesh.
-        marker = sphere_mesh.sample_points_uniformly(number_of_points=500)
-        camera_marker_clouds.append(marker)
-    # Combine all markers into one point cloud.
-    all_points = [np.asarray(cloud.points) for cloud in camera_marker_clouds]
-    all_colors = [np.asarray(cloud.colors) for cloud in camera_marker_clouds]
-    if all_points:
-        all_points = np.vstack(all_points)
-        all_colors = np.vstack(all_colors)
-        camera_cloud = o3d.geometry.PointCloud()
-        camera_cloud.points = o3d.utility.Vector3dVector(all_points)
-        camera_cloud.colors = o3d.utility.Vector3dVector(all_colors)
-    else:
-        camera_cloud = o3d.geometry.PointCloud()
+    # Scale and translate one unit-sphere sample to every camera position at once.
+    all_points = (_unit_sphere_points()[None, :, :] * sphere_radius + camera_positions[:, None, :]).reshape(-1, 3)
+    all_colors = np.broadcast_to([0.0, 1.0, 0.0], all_points.shape)
+    camera_cloud.points = o3d.utility.Vector3dVector(all_points)
+    camera_cloud.colors = o3d.utility.Vector3dVector(all_colors)
     return camera_cloud
 
 
@@ -321,16 +414,13 @@ def sample_line_points(line_set, num_samples=20):
         np.ndarray: Array of sampled points.
     """
     points = np.asarray(line_set.points)
-    sampled_points = []
+    lines = np.asarray(line_set.lines)
     # Each line is defined by two point indices.
-    for line in np.asarray(line_set.lines):
-        start = points[line[0]]
-        end = points[line[1]]
-        # Sample num_samples points along the line (including endpoints)
-        for t in np.linspace(0, 1, num_samples):
-            sample = start * (1 - t) + end * t
-            sampled_points.append(sample)
-    return np.array(sampled_points)
+    starts = points[lines[:, 0]][:, None, :]
+    ends = points[lines[:, 1]][:, None, :]
+    # Sample num_samples points along every line at once (including endpoints)
+    t = np.linspace(0, 1, num_samples)[None, :, None]
+    return (starts * (1 - t) + ends * t).reshape(-1, 3)
 
 def center_render(
         
@@ -384,11 +474,15 @@ def test_camera_positions(
         else:
             raise ValueError(f"Unsupported mask file format: {mask}")
 
-    # Load the geometry using a fixed background color.
-    geometry_type, coords, colors, geometry = load_geometry_from_file(point_cloud_path, [0.5, 0.5, 0.5])
+    # Load the geometry using a fixed background color. The cached entry is handed on to
+    # render_object_views so that it can apply its own background color without reloading.
+    point_cloud_path = str(point_cloud_path)
+    preloaded = _read_geometry(point_cloud_path, os.path.getmtime(point_cloud_path))
+    geometry_type, coords, file_colors, geometry = preloaded
+    colors = _geometry_colors(file_colors, len(coords), [0.5, 0.5, 0.5])
 
     # Create a copy of the mask as a numpy array
-    mask_array = np.array(mask, dtype=int)
+    mask_array = np.asarray(mask, dtype=np.int32)
 
     # Create a boolean mask for the specified object ID
     obj_mask: np.ndarray[bool] = mask_array == obj_id
@@ -396,7 +490,7 @@ def test_camera_positions(
         raise ValueError("Mask length does not match number of points in the geometry.")
 
     # Process the obj_mask to update colors (or generate an outline) per mask_mode.
-    vis_colors, outline = process_mask_mode(obj_mask, coords, colors.copy(), mask_mode, highlight_color)
+    vis_colors, outline = process_mask_mode(obj_mask, coords, colors, mask_mode, highlight_color)
     # Create the visualization geometry using the updated colors.
     vis_geometry = create_vis_geometry(geometry_type, coords, vis_colors, geometry)
 
@@ -436,13 +530,11 @@ def test_camera_positions(
     #     camera_height = center[2]
 
     # Generate camera positions evenly around the object.
-    camera_positions = []
     radius = bounding_radius * distance_factor
-    for i in range(num_positions):
-        angle = 2 * np.pi * i / num_positions
-        x = center[0] + radius * np.cos(angle)
-        y = center[1] + radius * np.sin(angle)
-        camera_positions.append([x, y, camera_height])
+    angles = np.linspace(0, 2 * np.pi, num_positions, endpoint=False)
+    camera_positions = np.column_stack((center[0] + radius * np.cos(angles),
+                                        center[1] + radius * np.sin(angles),
+                                        np.full(num_positions, camera_height)))
 
     # outlook
     scene_center = [center[0], center[1], camera_height]
@@ -458,25 +550,19 @@ def test_camera_positions(
     else:
         scene_cloud = vis_geometry
 
-    # If in "outline" mode, sample additional points from the outline and merge into the scene.
+    # Collect the scene, the outline samples (in "outline" mode) and the camera markers,
+    # then merge them with a single concatenation.
+    points_parts = [np.asarray(scene_cloud.points)]
+    colors_parts = [np.asarray(scene_cloud.colors)]
     if mask_mode == "outline" and outline is not None:
         sampled_outline_points = sample_line_points(outline, num_samples=20)
-        outline_colors = np.tile(np.array(highlight_color), (len(sampled_outline_points), 1))
-        outline_cloud = o3d.geometry.PointCloud()
-        outline_cloud.points = o3d.utility.Vector3dVector(sampled_outline_points)
-        outline_cloud.colors = o3d.utility.Vector3dVector(outline_colors)
-        # Merge the outline cloud with the scene cloud.
-        combined_points = np.vstack((np.asarray(scene_cloud.points), np.asarray(outline_cloud.points)))
-        combined_colors = np.vstack((np.asarray(scene_cloud.colors), np.asarray(outline_cloud.colors)))
-        scene_cloud.points = o3d.utility.Vector3dVector(combined_points)
-        scene_cloud.colors = o3d.utility.Vector3dVector(combined_colors)
-
-    # Combine the scene (with the masked object) with camera marker points.
-    combined_points = np.vstack((np.asarray(scene_cloud.points), np.asarray(camera_cloud.points)))
-    combined_colors = np.vstack((np.asarray(scene_cloud.colors), np.asarray(camera_cloud.colors)))
+        points_parts.append(sampled_outline_points)
+        colors_parts.append(np.broadcast_to(np.asarray(highlight_color, dtype=np.float64), sampled_outline_points.shape))
+    points_parts.append(np.asarray(camera_cloud.points))
+    colors_parts.append(np.asarray(camera_cloud.colors))
     combined_scene = o3d.geometry.PointCloud()
-    combined_scene.points = o3d.utility.Vector3dVector(combined_points)
-    combined_scene.colors = o3d.utility.Vector3dVector(combined_colors)
+    combined_scene.points = o3d.utility.Vector3dVector(np.concatenate(points_parts))
+    combined_scene.colors = o3d.utility.Vector3dVector(np.concatenate(colors_parts))
 
     # Save the combined scene (with camera markers and masked object) as a PLY file.
     os.makedirs(output_dir, exist_ok=True)
@@ -495,6 +581,7 @@ def test_camera_positions(
         debug=True,
         look_outward=look_outward,
         scene_center=scene_center,
+        preloaded=preloaded,
     )
 
 # *********************************************************************
@@ -558,56 +645,26 @@ def compute_camera_position(coords: np.ndarray,
     # min_bounds = np.min(coords, axis=0)
     # max_bounds = np.max(coords, axis=0)
     voxel_size, min_bounds, max_bounds = calculate_adaptive_voxel_size(coords)
-    num_voxels = np.ceil((max_bounds - min_bounds) / voxel_size).astype(int)
+    num_voxels = np.maximum(np.ceil((max_bounds - min_bounds) / voxel_size).astype(int), 1)
     radius = voxel_size * 0.8
     print("min_bounds:", min_bounds)
     print("max_bounds:", max_bounds)
     print("num_voxels:", num_voxels)
     print("num_voxels: ", num_voxels[0] * num_voxels[1] * num_voxels[2])
-    # 统计每个体素的点云数量
-    voxel_grid = {}
-    for x_id in range(num_voxels[0]):
-        for y_id in range(num_voxels[1]):
-            for z_id in range(num_voxels[2]):
-                voxel_grid[(x_id, y_id, z_id)] = []
-    for point in coords:
-        voxel_idx = tuple(((point - min_bounds) // voxel_size).astype(int))
-        # voxel_idx = np.clip(voxel_idx, 0 , num_voxels - 1)
-        voxel_grid[voxel_idx].append(point)
-
-    num_voxels_x, num_voxels_y, num_voxels_z = num_voxels
-    # 提取体素中心坐标和点数
-    voxel_centers_3d = np.full((num_voxels_x, num_voxels_y, num_voxels_z, 3), None)  # 存储体素中心
-    voxel_counts_3d = np.zeros((num_voxels_x, num_voxels_y, num_voxels_z), dtype=int)  # 存储体素点数
-    for idx in voxel_grid:
-        x_id, y_id, z_id = idx
-        # 计算体素中心
-        center = min_bounds + (np.array(idx) + 0.5) * voxel_size
-        # 填充到三维数组中
-        voxel_centers_3d[x_id, y_id, z_id] = center
-        voxel_counts_3d[x_id, y_id, z_id] = len(voxel_grid[idx])
-
-    voxel_centers_3d = np.array(voxel_centers_3d)
-    voxel_counts_3d = np.array(voxel_counts_3d)
+    # 统计每个体素的点云数量：一次算出所有点的体素线性下标，再用 bincount 计数
+    voxel_idx = ((coords - min_bounds) // voxel_size).astype(np.int64)
+    np.clip(voxel_idx, 0, num_voxels - 1, out=voxel_idx)  # 落在最大边界上的点归入最后一个体素
+    linear_idx = np.ravel_multi_index(voxel_idx.T, num_voxels)
+    voxel_counts_3d = np.bincount(linear_idx, minlength=np.prod(num_voxels)).reshape(num_voxels)
 
     threshold = np.percentile(voxel_counts_3d, density_percentile)
-    low_density_indices = np.array(np.where(voxel_counts_3d <= threshold)).T
-
-    distances_to_center = []
-    for idx in low_density_indices:
-        x_id, y_id, z_id = idx
-        # print(x_id, y_id, z_id)
-        center = voxel_centers_3d[x_id, y_id, z_id, :]
-        # print(center)
-        if None in center:
-            #print(f"Skipping voxel at index {idx} because center is None")
-            continue  # 如果是None，跳过这个点
-        else:
-            #print(f"Processing voxel at index {idx}, center: {center}")
-            distance = np.linalg.norm(center - scene_center)
-            distances_to_center.append((distance, idx, center))  # 记录距离和索引
+    low_density_indices = np.argwhere(voxel_counts_3d <= threshold)
 
-    distances_to_center.sort(key=lambda x: x[0])
+    # 低密度体素中心，按到场景中心的距离排序（稳定排序，距离相同时保持体素顺序）
+    low_density_centers = min_bounds + (low_density_indices + 0.5) * voxel_size
+    distances = np.linalg.norm(low_density_centers - scene_center, axis=1)
+    order = np.argsort(distances, kind="stable")
+    distances_to_center = list(zip(distances[order], low_density_indices[order], low_density_centers[order]))
 
     good_position = None
 
@@ -12,7 +12,6 @@ from google.genai import types
 from pydantic import BaseModel
 from typing import Union
 
-from inference import infer
 # Import the test_camera_positions function from view_rendering.py
 from view_rendering import test_camera_positions
 
@@ -140,7 +139,28 @@ def mask_obj_recognition(point_cloud_path: Union[str, Path], mask: Union[np.ndar
     return result
 
 
+def mask_obj_recognition_worker(args):
+    """
+    Process pool entry point for mask_obj_recognition.
+    Lives here rather than in app.py so that spawned workers only import this module.
+
+    Args:
+        args (tuple): (obj_id, point_cloud_path, num_points, indices), where indices are the points of the object.
+
+    Returns:
+        dict: The result of mask_obj_recognition for the object.
+    """
+    obj_id, point_cloud_path, num_points, indices = args
+    # Rebuild the object's mask from the indices of its points
+    mask_np = np.zeros(num_points, dtype=np.int32)
+    mask_np[indices] = obj_id
+    return mask_obj_recognition(point_cloud_path, mask_np, obj_id)
+
+
 if __name__ == '__main__':
+    # Only needed for this demo; keeps torch and the AGILE3D model out of process pool workers
+    from inference import infer
+
     load_dotenv()
 
     pcd_path = Path('agile3d/data/interactive_dataset/scene_00_reconstructed_01_transformed_mesh/scan.ply')
@@ -1,38 +1,73 @@
-from typing import List
+from typing import Tuple
+
+import numpy as np
+from numba import njit, prange
 
 SIZE = 1024
 
-def maximalRectangle(matrix: List[List[int]]) -> int:
+@njit(cache=True, boundscheck=False)
+def maximal_rectangle(matrix: np.ndarray) -> Tuple[int, int, int, int]:
     """
     Find the largest rectangle containing only 1s in a binary matrix.
-    Returns the area of the rectangle and its coordinates (n1, n2, m1, m2),
+    The matrix is a 2-D uint8 NumPy array.
+    Returns the coordinates of the rectangle (n1, n2, m1, m2),
     where n1 and n2 are the row indices and m1 and m2 are the column indices.
     """
-    n, m = len(matrix), len(matrix[0])
+    n, m = matrix.shape
     ans = 0
-    heights = [0] * m
-    n1 ,n2, m1, m2 = 0, 0, 0, 0
-    for i in range(n-1, -1, -1):
+    heights = np.zeros(m, dtype=np.int32)
+    stack = np.empty(m + 1, dtype=np.int32)
+    n1, n2, m1, m2 = 0, 0, 0, 0
+    for i in range(n - 1, -1, -1):
         for j in range(m):
-            if matrix[i][j] == 1:
+            if matrix[i, j] == 1:
                 heights[j] += 1
             else:
                 heights[j] = 0
-        
-        stack = []
+
+        top = 0
         for j in range(m + 1):
-            while stack and (j == m or heights[stack[-1]] > heights[j]):
-                h = heights[stack.pop()]
-                w = j if not stack else j - stack[-1] - 1
+            while top > 0 and (j == m or heights[stack[top - 1]] > heights[j]):
+                top -= 1
+                h = heights[stack[top]]
+                w = j if top == 0 else j - stack[top - 1] - 1
                 if h * w > ans:
                     ans = h * w
                     n1 = i
                     n2 = i + h - 1
-                    m1 = stack[-1] + 1 if stack else 0
+                    m1 = stack[top - 1] + 1 if top > 0 else 0
                     m2 = j - 1
-            stack.append(j)
+            stack[top] = j
+            top += 1
     return n1, n2, m1, m2
 
+@njit('void(float32[:, ::1], float32[::1], float32, float32, float32, float32, uint8[:, ::1])',
+      parallel=True, cache=True, fastmath=True)
+def _rasterize(coords, mn, inv_gx, inv_gy, z_lo, z_hi, matrix):
+    """
+    Set to 0 every cell of matrix that holds a point with z in [z_lo, z_hi].
+    The z test and cell index are computed in one pass over the points.
+    Points are processed in parallel, concurrent writes of 0 to one cell are harmless.
+    The explicit signature compiles the kernel eagerly for C-contiguous float32 input.
+    """
+    size_x, size_y = matrix.shape
+    for i in prange(coords.shape[0]):
+        z = coords[i, 2]
+        if z < z_lo or z > z_hi:
+            continue
+        ix = int((coords[i, 0] - mn[0]) * inv_gx)
+        iy = int((coords[i, 1] - mn[1]) * inv_gy)
+        # Points on the max boundary fall one cell past the grid
+        if ix >= size_x:
+            ix = size_x - 1
+        if iy >= size_y:
+            iy = size_y - 1
+        if ix >= 0 and iy >= 0:
+            matrix[ix, iy] = 0
+
+# Compile once at import so the first find_position call does not pay the JIT cost
+maximal_rectangle(np.ones((4, 4), dtype=np.uint8))
+
 def find_position(coords, height):
     """
     Find the camera position based on the point cloud coordinates and height.
@@ -51,17 +86,14 @@ def find_position(coords, height):
 
     # Create a matrix to represent the grid
     # 1 means empty, 0 means occupied
-    # The matrix is initialized to 1, then set to 0 for occupied cells
-    matrix = [[1 for _ in range(SIZE)] for _ in range(SIZE)]
-    for coord in coords:
-        if coord[2] < z_1 or coord[2] > z_2:
-            continue
-        x = int((coord[0] - min[0]) / grid_x)
-        y = int((coord[1] - min[1]) / grid_y)
-        matrix[x][y] = 0
-    
+    # The matrix is initialized to 1, then set to 0 for cells holding points in the z range
+    matrix = np.ones((SIZE, SIZE), dtype=np.uint8)
+    _rasterize(np.ascontiguousarray(coords, dtype=np.float32), min.astype(np.float32),
+               np.float32(SIZE / (max[0] - min[0])), np.float32(SIZE / (max[1] - min[1])),
+               np.float32(z_1), np.float32(z_2), matrix)
+
     # Find the maximal rectangle in the matrix
-    n1, n2, m1, m2 = maximalRectangle(matrix)
+    n1, n2, m1, m2 = maximal_rectangle(matrix)
 
     # Calculate the camera position based on the maximal rectangle
     position_x = min[0] + (n1 + n2 + 1) / 2 * grid_x